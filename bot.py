@@ -4,6 +4,7 @@ Main entry point for the Time & Activity Tracker Telegram Bot.
 Initializes the database, sets up logging, creates the Telegram bot application,
 registers handlers, schedules jobs, and starts the bot.
 """
+import asyncio
 import logging
 import os
 from datetime import time, timezone  # Keep timezone for UTC schedule
@@ -50,6 +51,17 @@ if not BOT_TOKEN:
 
 # --- Main Application Setup ---
 
+async def _post_init(application: Application) -> None:
+    """Tunes the running event loop once PTB has created it."""
+    loop = asyncio.get_running_loop()
+    # Python 3.12+: run coroutines eagerly and only materialize a Task if
+    # they actually suspend — most PTB-internal create_task calls finish
+    # without yielding, so this skips a Task allocation per update
+    if hasattr(asyncio, "eager_task_factory"):
+        loop.set_task_factory(asyncio.eager_task_factory)
+        logger.info("Eager task factory enabled.")
+
+
 def main() -> None:
     """Initializes DB, creates PTB application, registers handlers/jobs, runs bot."""
     logger.info("Starting bot initialization...")
@@ -63,7 +75,8 @@ def main() -> None:
 
     # 2. Create the Application
     # Consider adding persistence=PicklePersistence(filepath='./bot_data_persist') for bot_data/user_data
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(
+        BOT_TOKEN).post_init(_post_init).build()
 
     # 3. Register Handlers
     # Commands
@@ -72,7 +85,14 @@ def main() -> None:
     application.add_handler(CommandHandler("report", handlers.report_handler))
     application.add_handler(CommandHandler(
         "hide_keyboard", handlers.hide_keyboard_handler))
-    application.add_handler(CommandHandler("asknow", handlers.ask_now_handler))
+    # Owner check is partial-evaluated into the handler filter: non-owner
+    # /asknow messages never reach the coroutine at all
+    if handlers.OWNER_ID:
+        application.add_handler(CommandHandler(
+            "asknow", handlers.ask_now_handler,
+            filters=filters.User(user_id=handlers.OWNER_ID)))
+    else:
+        logger.warning("OWNER_ID not configured; /asknow command disabled.")
     application.add_handler(CommandHandler(
         "set_timezone", handlers.set_timezone_handler))
     application.add_handler(CommandHandler(
@@ -129,12 +149,18 @@ def main() -> None:
                 name="ask_activity_cron_job"
             )
             logger.info(
-                f"Scheduled 'ask_activity' job with trigger: {trigger_ask}")
+                "Scheduled 'ask_activity' job with trigger: %s", trigger_ask)
         except Exception as e:
             logger.error(
                 f"Failed to schedule ask_activity job: {e}", exc_info=True)
 
         # Daily report check job
+        #
+        # Deliberately a pull-model hourly scan rather than one APScheduler
+        # cron trigger per (user, report_hour, tz): per-user triggers would
+        # need a persistent job store (extra dependency) to survive restarts
+        # and careful rescheduling on every settings change, while the scan
+        # is one batched query per hour and self-heals from the users table.
         try:
             # Runs hourly at 5 mins past hour
             trigger_report_check = CronTrigger(minute='5')
@@ -145,7 +171,8 @@ def main() -> None:
                 name="check_daily_reports_job"
             )
             logger.info(
-                f"Scheduled daily report check job hourly (trigger: {trigger_report_check}).")
+                "Scheduled daily report check job hourly (trigger: %s).",
+                trigger_report_check)
         except Exception as e:
             logger.error(
                 f"Failed to schedule report check job: {e}", exc_info=True)
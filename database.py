@@ -5,10 +5,13 @@ Handles SQLite database connection, table creation, and data operations
 for users and their activities, including settings like timezone,
 polling window, and report time preferences.
 """
+import functools
 import logging
 import os
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from datetime import date, datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
@@ -17,14 +20,68 @@ DB_FOLDER = "data"
 DB_NAME = "activities.db"
 DB_PATH = os.path.join(DB_FOLDER, DB_NAME)
 
+# TTL (seconds) for the in-process per-user settings cache
+SETTINGS_CACHE_TTL = 60.0
+
+
+# --- In-Process Settings Cache ---
+
+# Maps (setting_name, user_id) -> (value, expiry_monotonic). Settings are
+# read far more often than they change (every button press and job tick),
+# so a short TTL plus setter invalidation turns most SQLite queries into
+# dict lookups.
+_settings_cache: dict[tuple[str, int], tuple] = {}
+
+
+def _cached_setting(name: str):
+    """
+    Decorator caching a per-user getter's result for SETTINGS_CACHE_TTL.
+
+    Args:
+        name: Cache key prefix identifying the setting.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(user_id: int):
+            key = (name, user_id)
+            hit = _settings_cache.get(key)
+            now = time.monotonic()
+            if hit is not None and hit[1] > now:
+                return hit[0]
+            value = fn(user_id)
+            _settings_cache[key] = (value, now + SETTINGS_CACHE_TTL)
+            return value
+        return wrapper
+    return decorator
+
+
+def _invalidate_cached_setting(name: str, user_id: int):
+    """Drops a cached setting entry after the corresponding setter runs."""
+    _settings_cache.pop((name, user_id), None)
+
+
+def _warm_cached_setting(name: str, user_id: int, value):
+    """Pre-populates a cache entry (used by batched reads)."""
+    _settings_cache[(name, user_id)] = (
+        value, time.monotonic() + SETTINGS_CACHE_TTL
+    )
+
 
 # --- Private Helper Functions ---
 
+# One live connection per thread. Handlers run database calls on the
+# asyncio.to_thread worker pool, so a small, stable set of threads ends
+# up reusing a handful of connections instead of paying the
+# connect/PRAGMA cost on every single query.
+_thread_local = threading.local()
+
+
 def _get_db_connection() -> sqlite3.Connection:
     """
-    Establishes a connection to the SQLite database.
+    Returns this thread's cached connection to the SQLite database.
 
-    Ensures the data folder exists and enables foreign key support.
+    On first use per thread, ensures the data folder exists, connects and
+    enables foreign key support; later calls reuse the open connection.
 
     Returns:
         sqlite3.Connection: The database connection object.
@@ -33,19 +90,28 @@ def _get_db_connection() -> sqlite3.Connection:
         sqlite3.Error: If connection fails.
         OSError: If directory creation fails.
     """
+    con = getattr(_thread_local, "con", None)
+    if con is not None:
+        return con
     try:
         # Ensure data directory exists
         if not os.path.exists(DB_FOLDER):
             os.makedirs(DB_FOLDER)
-            logger.info(f"Created database folder at '{DB_FOLDER}'.")
+            logger.info("Created database folder at '%s'.", DB_FOLDER)
 
         # Connect to the database file
         con = sqlite3.connect(DB_PATH)
 
         # Enable foreign key constraint enforcement for this connection
         con.execute("PRAGMA foreign_keys = ON;")
+        # WAL lets readers proceed during writes and, with synchronous=
+        # NORMAL, skips the per-commit fsync while staying crash-safe
+        # (power loss can only drop the very last transactions)
+        con.execute("PRAGMA journal_mode = WAL;")
+        con.execute("PRAGMA synchronous = NORMAL;")
         logger.debug(
             "Database connection established with foreign keys enabled.")
+        _thread_local.con = con
         return con
     except sqlite3.Error as e:
         logger.error(f"Error connecting to DB '{DB_PATH}': {e}")
@@ -92,6 +158,13 @@ def _create_tables(con: sqlite3.Connection):
             )
         """)
 
+        # Report queries filter by user and day; the composite index turns
+        # them into range scans instead of full-history table scans
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_activities_user_timestamp
+            ON activities (user_id, timestamp)
+        """)
+
         con.commit()
         logger.info("Database table structure check/creation complete.")
     except sqlite3.Error as e:
@@ -104,11 +177,10 @@ def _create_tables(con: sqlite3.Connection):
 
 def initialize_database():
     """Initializes the database by ensuring connection and creating tables."""
-    logger.info(f"Initializing database at '{DB_PATH}'...")
+    logger.info("Initializing database at '%s'...", DB_PATH)
     try:
         con = _get_db_connection()
         _create_tables(con)
-        con.close()
         logger.info("Database initialization finished successfully.")
     except Exception as e:
         # Log critical error if DB init fails, as bot likely cannot run
@@ -138,7 +210,6 @@ def add_user_if_not_exists(user_id: int, username: str | None, first_name: str):
         VALUES (?, ?, ?, ?, NULL, NULL, 8, 22, 8) -- Set default values here
     """
     now_iso = datetime.now().isoformat()
-    con = None
     try:
         con = _get_db_connection()
         cur = con.cursor()
@@ -146,19 +217,18 @@ def add_user_if_not_exists(user_id: int, username: str | None, first_name: str):
         con.commit()
         if cur.rowcount > 0:
             logger.info(
-                f"New user user_id={user_id}, username={username} added to DB."
+                "New user user_id=%s, username=%s added to DB.",
+                user_id, username
             )
         else:
             logger.debug(
-                f"User user_id={user_id}, username={username} already exists."
+                "User user_id=%s, username=%s already exists.",
+                user_id, username
             )
     except sqlite3.Error as e:
         logger.error(
             f"Error adding/checking user user_id={user_id} in DB: {e}"
         )
-    finally:
-        if con:
-            con.close()
 
 
 def update_user_timezone(user_id: int, timezone_str: str | None) -> bool:
@@ -182,8 +252,9 @@ def update_user_timezone(user_id: int, timezone_str: str | None) -> bool:
         con.commit()
         if cur.rowcount > 0:
             success = True
+            _invalidate_cached_setting("timezone", user_id)
             logger.info(
-                f"Timezone for user {user_id} updated to '{timezone_str}'."
+                "Timezone for user %s updated to '%s'.", user_id, timezone_str
             )
         else:
             logger.warning(
@@ -196,12 +267,10 @@ def update_user_timezone(user_id: int, timezone_str: str | None) -> bool:
         if con:
             con.rollback()
         success = False
-    finally:
-        if con:
-            con.close()
     return success
 
 
+@_cached_setting("timezone")
 def get_user_timezone_str(user_id: int) -> str | None:
     """
     Gets the timezone string (IANA name) for a given user.
@@ -214,7 +283,6 @@ def get_user_timezone_str(user_id: int) -> str | None:
     """
     sql = "SELECT timezone FROM users WHERE user_id = ?"
     timezone_str = None
-    con = None
     try:
         con = _get_db_connection()
         cur = con.cursor()
@@ -223,15 +291,13 @@ def get_user_timezone_str(user_id: int) -> str | None:
         if result and result[0]:
             timezone_str = result[0]
         logger.debug(
-            f"Timezone for user {user_id}: '{timezone_str if timezone_str else 'Not set'}'."
+            "Timezone for user %s: '%s'.",
+            user_id, timezone_str if timezone_str else "Not set"
         )
     except sqlite3.Error as e:
         logger.error(
             f"SQLite error retrieving timezone for user {user_id}: {e}"
         )
-    finally:
-        if con:
-            con.close()
     return timezone_str
 
 
@@ -239,22 +305,65 @@ def get_all_user_ids_with_tz() -> list[int]:
     """Returns a list of unique user_ids that have a timezone set."""
     user_ids = []
     sql = "SELECT user_id FROM users WHERE timezone IS NOT NULL AND timezone != ''"
-    con = None
     try:
         con = _get_db_connection()
         cur = con.cursor()
         cur.execute(sql)
         results = cur.fetchall()
         user_ids = [row[0] for row in results]
-        logger.info(f"Found {len(user_ids)} users with timezone set.")
+        logger.info("Found %s users with timezone set.", len(user_ids))
     except sqlite3.Error as e:
         logger.error(f"SQLite error retrieving users with timezone: {e}")
-    finally:
-        if con:
-            con.close()
     return user_ids
 
 
+def get_users_due_for_report() -> list[tuple[int, str, int, str | None]]:
+    """
+    Retrieves report-check data for all users with a timezone in one query.
+
+    Replaces the per-user getter round-trips in the hourly report job
+    (timezone, report hour, last sent date) with a single SELECT. The
+    final "is it report time" filter stays in the caller, since it
+    depends on each user's local time.
+
+    Returns:
+        A list of tuples (user_id, timezone_str, report_hour, last_sent_date),
+        where report_hour falls back to the schema default and
+        last_sent_date may be None. Returns empty list on error.
+    """
+    rows = []
+    sql = """
+        SELECT user_id, timezone, COALESCE(report_time_hour, 8),
+               last_daily_report_sent_date
+        FROM users
+        WHERE timezone IS NOT NULL AND timezone != ''
+    """
+    try:
+        con = _get_db_connection()
+        cur = con.cursor()
+        cur.execute(sql)
+        raw_rows = cur.fetchall()
+        # Pre-warm the settings cache so follow-up lookups hit the dict.
+        # Apply the same 0-23 validation as get_user_report_hour: an
+        # out-of-range stored hour warms the cache with None (the
+        # getter's contract) and falls back to the schema default here.
+        for user_id, tz_str, report_hour, last_sent in raw_rows:
+            if not 0 <= report_hour <= 23:
+                logger.warning(
+                    f"Invalid report hour ({report_hour}) found in DB for user {user_id}.")
+                _warm_cached_setting("report_hour", user_id, None)
+                report_hour = 8
+            else:
+                _warm_cached_setting("report_hour", user_id, report_hour)
+            _warm_cached_setting("timezone", user_id, tz_str)
+            rows.append((user_id, tz_str, report_hour, last_sent))
+        logger.info("Found %s users to check for daily reports.", len(rows))
+    except sqlite3.Error as e:
+        logger.error(f"SQLite error retrieving report candidates: {e}")
+        rows = []
+    return rows
+
+
 def get_last_report_sent_date(user_id: int) -> str | None:
     """
     Gets the last date string ('YYYY-MM-DD') for which a daily report was sent.
@@ -267,7 +376,6 @@ def get_last_report_sent_date(user_id: int) -> str | None:
     """
     sql = "SELECT last_daily_report_sent_date FROM users WHERE user_id = ?"
     date_str = None
-    con = None
     try:
         con = _get_db_connection()
         cur = con.cursor()
@@ -276,15 +384,13 @@ def get_last_report_sent_date(user_id: int) -> str | None:
         if result and result[0]:
             date_str = result[0]
         logger.debug(
-            f"Last report sent date for user {user_id}: {date_str if date_str else 'Never'}"
+            "Last report sent date for user %s: %s",
+            user_id, date_str if date_str else "Never"
         )
     except sqlite3.Error as e:
         logger.error(
             f"SQLite error getting last report sent date for user {user_id}: {e}"
         )
-    finally:
-        if con:
-            con.close()
     return date_str
 
 
@@ -310,7 +416,8 @@ def update_last_report_sent_date(user_id: int, date_str: str) -> bool:
         if cur.rowcount > 0:
             success = True
             logger.info(
-                f"Updated last report sent date for user {user_id} to {date_str}."
+                "Updated last report sent date for user %s to %s.",
+                user_id, date_str
             )
         else:
             # This might happen if the user was deleted between job start and update
@@ -324,12 +431,46 @@ def update_last_report_sent_date(user_id: int, date_str: str) -> bool:
         if con:
             con.rollback()
         success = False
-    finally:
-        if con:
-            con.close()
     return success
 
 
+def update_last_report_sent_dates(updates: list[tuple[str, int]]) -> int:
+    """
+    Batch-updates last sent report dates in a single transaction.
+
+    One commit (and thus one fsync) covers the whole batch, instead of
+    one transaction per user as with update_last_report_sent_date.
+
+    Args:
+        updates: List of (date_str, user_id) tuples to apply.
+
+    Returns:
+        The number of rows updated (0 on error or empty input).
+    """
+    if not updates:
+        return 0
+    sql = "UPDATE users SET last_daily_report_sent_date = ? WHERE user_id = ?"
+    updated = 0
+    con = None
+    try:
+        con = _get_db_connection()
+        cur = con.cursor()
+        cur.executemany(sql, updates)
+        con.commit()
+        updated = cur.rowcount
+        logger.info(
+            "Batch-updated last report sent date for %s users.", updated
+        )
+    except sqlite3.Error as e:
+        logger.error(
+            f"SQLite error batch-updating last report sent dates: {e}"
+        )
+        if con:
+            con.rollback()
+        updated = 0
+    return updated
+
+
 def save_activity_to_db(
         user_id: int, description: str, timestamp: datetime
 ) -> int | None:
@@ -347,7 +488,6 @@ def save_activity_to_db(
     # Timestamp should be timezone-aware (UTC) before calling isoformat()
     sql = "INSERT INTO activities (user_id, description, timestamp) VALUES (?, ?, ?)"
     activity_id = None
-    con = None
     try:
         con = _get_db_connection()
         cur = con.cursor()
@@ -355,18 +495,28 @@ def save_activity_to_db(
         activity_id = cur.lastrowid
         con.commit()
         logger.info(
-            f"Activity '{description[:20]}...' for user {user_id} saved "
-            f"with ID {activity_id} at {timestamp.isoformat()}."
+            "Activity '%s...' for user %s saved with ID %s at %s.",
+            description[:20], user_id, activity_id, timestamp.isoformat()
         )
     except sqlite3.Error as e:
         logger.error(f"Error saving activity for user {user_id} to DB: {e}")
         activity_id = None
-    finally:
-        if con:
-            con.close()
     return activity_id
 
 
+def _day_bounds(report_date: str) -> tuple[str, str]:
+    """
+    Returns the half-open [start, end) ISO-string bounds for a date.
+
+    Timestamps are stored as fixed-format UTC ISO strings, so comparing
+    them lexicographically against day boundaries is equivalent to
+    DATE(timestamp) = ? — but, unlike the function call, it lets SQLite
+    range-scan the (user_id, timestamp) index.
+    """
+    next_day = date.fromisoformat(report_date) + timedelta(days=1)
+    return report_date, next_day.isoformat()
+
+
 def get_activities_for_day(
         user_id: int, report_date: str
 ) -> list[tuple[int, str, str]]:
@@ -386,18 +536,18 @@ def get_activities_for_day(
     sql = """
         SELECT activity_id, timestamp, description
         FROM activities
-        WHERE user_id = ? AND DATE(timestamp) = ?
+        WHERE user_id = ? AND timestamp >= ? AND timestamp < ?
         ORDER BY timestamp ASC
     """
-    con = None
     try:
+        day_start, day_end = _day_bounds(report_date)
         con = _get_db_connection()
         cur = con.cursor()
-        cur.execute(sql, (user_id, report_date))
+        cur.execute(sql, (user_id, day_start, day_end))
         activities_list = cur.fetchall()
         logger.info(
-            f"Found {len(activities_list)} activities for user {user_id} "
-            f"on date {report_date}."
+            "Found %s activities for user %s on date %s.",
+            len(activities_list), user_id, report_date
         )
     except sqlite3.Error as e:
         logger.error(
@@ -405,12 +555,58 @@ def get_activities_for_day(
             f"on date {report_date}: {e}"
         )
         activities_list = []  # Ensure empty list on error
-    finally:
-        if con:
-            con.close()
     return activities_list
 
 
+def get_activity_blocks_for_day(
+        user_id: int, report_date: str
+) -> list[tuple[str, str]]:
+    """
+    Retrieves only the activity rows where the description changes.
+
+    Collapsing runs of identical descriptions is done server-side with a
+    LAG window function, so SQLite returns just the block-transition rows
+    instead of every activity. Each returned row marks the start of a new
+    block; the next row's timestamp is that block's end.
+
+    Args:
+        user_id: The user's Telegram ID.
+        report_date: The date string in 'YYYY-MM-DD' format.
+
+    Returns:
+        A list of tuples (timestamp_str_utc, description), ordered by
+        timestamp. Returns empty list on error or if no data.
+    """
+    blocks_list = []
+    sql = """
+        SELECT timestamp, description FROM (
+            SELECT timestamp, description,
+                   LAG(description) OVER (ORDER BY timestamp) AS prev
+            FROM activities
+            WHERE user_id = ? AND timestamp >= ? AND timestamp < ?
+        )
+        WHERE prev IS NULL OR prev <> description
+        ORDER BY timestamp ASC
+    """
+    try:
+        day_start, day_end = _day_bounds(report_date)
+        con = _get_db_connection()
+        cur = con.cursor()
+        cur.execute(sql, (user_id, day_start, day_end))
+        blocks_list = cur.fetchall()
+        logger.info(
+            "Found %s activity blocks for user %s on date %s.",
+            len(blocks_list), user_id, report_date
+        )
+    except sqlite3.Error as e:
+        logger.error(
+            f"SQLite error retrieving activity blocks for user {user_id} "
+            f"on date {report_date}: {e}"
+        )
+        blocks_list = []  # Ensure empty list on error
+    return blocks_list
+
+
 def update_activity_description(
         activity_id: int, user_id: int, new_description: str
 ) -> bool:
@@ -440,7 +636,7 @@ def update_activity_description(
         if cur.rowcount > 0:
             updated = True
             logger.info(
-                f"Activity ID {activity_id} for user {user_id} updated."
+                "Activity ID %s for user %s updated.", activity_id, user_id
             )
         else:
             # Could be wrong activity_id or wrong user_id
@@ -455,12 +651,10 @@ def update_activity_description(
         if con:
             con.rollback()
         updated = False
-    finally:
-        if con:
-            con.close()
     return updated
 
 
+@_cached_setting("poll_window")
 def get_user_poll_window(user_id: int) -> tuple[int, int] | None:
     """
     Gets the custom polling window (start_hour, end_hour) for the user.
@@ -473,7 +667,6 @@ def get_user_poll_window(user_id: int) -> tuple[int, int] | None:
     """
     sql = "SELECT poll_start_hour, poll_end_hour FROM users WHERE user_id = ?"
     window = None
-    con = None
     try:
         con = _get_db_connection()
         cur = con.cursor()
@@ -488,16 +681,14 @@ def get_user_poll_window(user_id: int) -> tuple[int, int] | None:
                 logger.warning(
                     f"Invalid poll window ({start_h}-{end_h}) found in DB for user {user_id}.")
         logger.debug(
-            f"Poll window for user {user_id}: "
-            f"{f'{window[0]}-{window[1]}' if window else 'Not set/Invalid (using defaults)'}."
+            "Poll window for user %s: %s.",
+            user_id,
+            "%s-%s" % window if window else "Not set/Invalid (using defaults)"
         )
     except (sqlite3.Error, ValueError) as e:
         logger.error(
             f"Error retrieving/parsing poll window for user {user_id}: {e}"
         )
-    finally:
-        if con:
-            con.close()
     return window
 
 
@@ -524,8 +715,10 @@ def update_user_poll_window(user_id: int, start_hour: int, end_hour: int) -> boo
         con.commit()
         if cur.rowcount > 0:
             success = True
+            _invalidate_cached_setting("poll_window", user_id)
             logger.info(
-                f"Poll window for user {user_id} updated to {start_hour}-{end_hour}."
+                "Poll window for user %s updated to %s-%s.",
+                user_id, start_hour, end_hour
             )
         else:
             logger.warning(
@@ -538,12 +731,10 @@ def update_user_poll_window(user_id: int, start_hour: int, end_hour: int) -> boo
         if con:
             con.rollback()
         success = False
-    finally:
-        if con:
-            con.close()
     return success
 
 
+@_cached_setting("report_hour")
 def get_user_report_hour(user_id: int) -> int | None:
     """
     Gets the preferred report hour (0-23) for the user.
@@ -556,7 +747,6 @@ def get_user_report_hour(user_id: int) -> int | None:
     """
     sql = "SELECT report_time_hour FROM users WHERE user_id = ?"
     hour = None
-    con = None
     try:
         con = _get_db_connection()
         cur = con.cursor()
@@ -571,16 +761,14 @@ def get_user_report_hour(user_id: int) -> int | None:
                 logger.warning(
                     f"Invalid report hour ({h}) found in DB for user {user_id}.")
         logger.debug(
-            f"Report hour for user {user_id}: "
-            f"{hour if hour is not None else 'Not set/Invalid (using default)'}."
+            "Report hour for user %s: %s.",
+            user_id,
+            hour if hour is not None else "Not set/Invalid (using default)"
         )
     except (sqlite3.Error, ValueError) as e:
         logger.error(
             f"Error retrieving/parsing report hour for user {user_id}: {e}"
         )
-    finally:
-        if con:
-            con.close()
     return hour
 
 
@@ -606,7 +794,8 @@ def update_user_report_hour(user_id: int, hour: int) -> bool:
         con.commit()
         if cur.rowcount > 0:
             success = True
-            logger.info(f"Report hour for user {user_id} updated to {hour}.")
+            _invalidate_cached_setting("report_hour", user_id)
+            logger.info("Report hour for user %s updated to %s.", user_id, hour)
         else:
             logger.warning(
                 f"Could not update report hour for user {user_id} (user not found?)."
@@ -618,7 +807,4 @@ def update_user_report_hour(user_id: int, hour: int) -> bool:
         if con:
             con.rollback()
         success = False
-    finally:
-        if con:
-            con.close()
     return success
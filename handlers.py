@@ -2,11 +2,12 @@
 Callback handlers for the Telegram bot commands, messages, and buttons.
 """
 import asyncio
-import io
+import functools
+import itertools
 import logging
 import os
-import re
-from datetime import datetime, timedelta, timezone
+import time
+from datetime import date, datetime, timedelta, timezone
 
 # Third-party imports
 import zoneinfo
@@ -39,27 +40,326 @@ DEFAULT_POLL_START_HOUR = 8
 DEFAULT_POLL_END_HOUR = 22
 DEFAULT_REPORT_HOUR = 8
 
+TZ_LINK_URL = "https://en.wikipedia.org/wiki/List_of_tz_database_time_zones"
+
+# Static instruction bodies for the settings buttons, built once at import
+# time instead of being re-concatenated on every button press
+_TZ_INSTRUCTIONS = (
+    "To set or change it, use the command followed by the timezone name.\n"
+    "Example: <code>/set_timezone Asia/Almaty</code>\n\n"
+    f"Find standard names (IANA format) <a href='{TZ_LINK_URL}'>here</a>."
+)
+_POLL_INSTRUCTIONS = (
+    "To change it, use the command followed by start and end hours (0-23).\n"
+    "Example: <code>/set_poll_window 9 18</code>"
+)
+_REPORT_INSTRUCTIONS = (
+    "To change it, use the command followed by the desired hour (0-23).\n"
+    "Example: <code>/set_report_time 7</code> (for 7 AM)"
+)
+
+# Main menu keyboard shown by /start and /help. The markup is immutable
+# and identical for every user, so build it once at import time.
+_MAIN_MENU = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton("📊 Activity Report")],
+        [KeyboardButton("🌐 Set Timezone"),
+         KeyboardButton("⏰ Set Poll Window")],
+        [KeyboardButton("🗓️ Set Report Time"),
+         KeyboardButton("❓ Help / Show Menu")],
+        [KeyboardButton("⌨️ Hide Keyboard")]
+    ],
+    resize_keyboard=True, one_time_keyboard=False,
+    input_field_placeholder="Use menu or reply to questions..."
+)
+
 
 # --- Helper Functions ---
 
-def _get_user_local_time(user_id: int, dt_utc_aware: datetime) -> datetime:
-    """Converts a timezone-aware UTC datetime to the user's local timezone."""
-    tz_str = database.get_user_timezone_str(user_id)
+# Keys of handler invocations currently running, for single-flighting
+_inflight_handlers: set = set()
+
+
+def _single_flight(key: str):
+    """
+    Drops duplicate concurrent invocations of a handler per user.
+
+    Rapid repeated button presses would otherwise each hit SQLite and the
+    Telegram API. While an invocation for (user_id, key) is in flight,
+    later ones return immediately.
+
+    Args:
+        key: Short name identifying the guarded handler.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            user = update.effective_user
+            if not user:
+                return await fn(update, context)
+            flight_key = (user.id, key)
+            if flight_key in _inflight_handlers:
+                logger.debug(
+                    "Dropping duplicate '%s' press from user %s.", key, user.id)
+                return
+            _inflight_handlers.add(flight_key)
+            try:
+                return await fn(update, context)
+            finally:
+                _inflight_handlers.discard(flight_key)
+        return wrapper
+    return decorator
+
+
+class _TokenBucket:
+    """Simple async token bucket used to cap the outgoing message rate."""
+
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Waits until a token is available, then consumes it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity,
+                    self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+TG_SEND_RATE_PER_SEC = 25  # Stay under Telegram's ~30 msg/s global cap
+
+# Process-wide limiter shared by every job that sends messages, so the
+# activity poll and daily reports cooperate under one budget
+_tg_send_limiter = _TokenBucket(
+    rate=TG_SEND_RATE_PER_SEC, capacity=TG_SEND_RATE_PER_SEC)
+
+
+async def _db(fn, *args):
+    """
+    Runs a blocking database call in a worker thread.
+
+    The database module uses synchronous sqlite3, which would otherwise
+    stall the event loop for the duration of each query. Use this from
+    async handlers: `await _db(database.get_user_timezone_str, user_id)`.
+    """
+    return await asyncio.to_thread(fn, *args)
+
+
+def _parse_ymd(s: str) -> date:
+    """
+    Parses a strict 'YYYY-MM-DD' string into a date.
+
+    Cheaper than datetime.strptime, which drags in the whole format
+    machinery for a fixed 10-character layout. The shape check rejects
+    other ISO-8601 forms; fromisoformat (C-accelerated) does the strict
+    digit and range validation that bare int() would let through.
+
+    Raises:
+        ValueError: If the string is not a valid YYYY-MM-DD date.
+    """
+    if len(s) != 10 or s[4] != '-' or s[7] != '-':
+        raise ValueError(f"Invalid date format: {s!r}")
+    return date.fromisoformat(s)
+
+
+@functools.lru_cache(maxsize=4096)
+def _zoneinfo(name: str) -> ZoneInfo:
+    """
+    Returns a cached ZoneInfo for the given IANA name.
+
+    Constructing a ZoneInfo parses tzdata from disk, so the jobs that run
+    per user per hour would otherwise re-read the same files constantly.
+    Raises ZoneInfoNotFoundError for unknown names (not cached).
+    """
+    return ZoneInfo(name)
+
+
+# Cache of per-user time formatters used by the report loops.
+# Invalidated when the user changes their timezone.
+_time_formatter_cache = {}
+
+
+def _make_time_formatter(tz_str: str | None):
+    """
+    Builds a specialized 'ISO timestamp -> HH:MM local' formatter.
+
+    Most users keep one timezone forever, so the tz lookup and validation
+    are done once here instead of once per report row. The returned
+    closure only parses the timestamp, converts it and formats the time.
+
+    Args:
+        tz_str: The user's IANA timezone name (or None for UTC).
+
+    Returns:
+        A function mapping an ISO timestamp string to an 'HH:MM' string.
+    """
+    user_tz = None
     if tz_str:
         try:
-            user_tz = ZoneInfo(tz_str)
-            return dt_utc_aware.astimezone(user_tz)
+            user_tz = _zoneinfo(tz_str)
         except ZoneInfoNotFoundError:
             logger.error(
-                f"Invalid timezone '{tz_str}' in DB for user {user_id}. Using UTC."
-            )
-            return dt_utc_aware
-        except Exception as e:
-            logger.error(f"Error converting time for user {user_id}: {e}")
-            return dt_utc_aware
+                f"Invalid timezone '{tz_str}' for formatter. Using UTC.")
+            user_tz = None
+
+    if user_tz is not None:
+        def formatter(iso_str: str) -> str:
+            dt = datetime.fromisoformat(iso_str).astimezone(user_tz)
+            return f"{dt.hour:02d}:{dt.minute:02d}"
     else:
-        logger.debug(f"No timezone set for user {user_id}. Using UTC.")
+        # Timestamps are fixed-width UTC ISO strings and the UTC fallback
+        # needs no conversion, so HH:MM is just a slice — no datetime
+        # object per row at all
+        def formatter(iso_str: str) -> str:
+            if len(iso_str) >= 16:
+                return iso_str[11:16]
+            raise ValueError(f"Timestamp too short: {iso_str!r}")
+    return formatter
+
+
+def _get_time_formatter(user_id: int):
+    """Returns (building and caching if needed) the user's time formatter."""
+    formatter = _time_formatter_cache.get(user_id)
+    if formatter is None:
+        tz_str = database.get_user_timezone_str(user_id)
+        formatter = _make_time_formatter(tz_str)
+        _time_formatter_cache[user_id] = formatter
+    return formatter
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_local_date(user_id: int, _minute_bucket: int):
+    """
+    Returns the user's current local date, cached for up to a minute.
+
+    The `_minute_bucket` argument (int(time.time()) // 60) is only there to
+    expire cache entries, so repeated /report calls within the same minute
+    skip the timezone lookup and conversion entirely.
+    """
+    return _get_user_local_time(user_id, datetime.now(timezone.utc)).date()
+
+
+# Date-selection keyboards for /report, keyed by the local "today" date.
+# Keyboards are immutable once built, so one object per date serves every
+# user whose local calendar agrees.
+_report_menu_cache: dict = {}
+
+
+def _get_report_menu_markup(today_local: date) -> InlineKeyboardMarkup:
+    """Returns the Today/Yesterday/Cancel markup for the given local date."""
+    reply_markup = _report_menu_cache.get(today_local)
+    if reply_markup is None:
+        today_str = today_local.isoformat()
+        yesterday_str = (today_local - timedelta(days=1)).isoformat()
+        keyboard = [[
+            InlineKeyboardButton(
+                "Today", callback_data=f"report_select:activity:{today_str}"),
+            InlineKeyboardButton(
+                "Yesterday", callback_data=f"report_select:activity:{yesterday_str}")
+        ], [
+            InlineKeyboardButton(
+                "Cancel", callback_data="report_select:cancel")
+        ]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        # At most a few dates are ever live at once (timezones straddling
+        # midnight); keep the cache from accumulating history
+        if len(_report_menu_cache) > 4:
+            _report_menu_cache.clear()
+        _report_menu_cache[today_local] = reply_markup
+    return reply_markup
+
+
+def _resolve_user_tz(user_id: int) -> ZoneInfo | None:
+    """
+    Resolves a user's ZoneInfo, or None when unset/invalid (meaning UTC).
+
+    The timezone string getter is TTL-cached at the database layer and
+    the ZoneInfo construction is lru-cached, so calling this repeatedly
+    is two dict probes; callers in loops should still resolve once and
+    reuse the result.
+    """
+    tz_str = database.get_user_timezone_str(user_id)
+    if not tz_str:
+        logger.debug("No timezone set for user %s. Using UTC.", user_id)
+        return None
+    try:
+        return _zoneinfo(tz_str)
+    except ZoneInfoNotFoundError:
+        logger.error(
+            f"Invalid timezone '{tz_str}' in DB for user {user_id}. Using UTC."
+        )
+        return None
+
+
+def _get_user_local_time(user_id: int, dt_utc_aware: datetime) -> datetime:
+    """Converts a timezone-aware UTC datetime to the user's local timezone."""
+    user_tz = _resolve_user_tz(user_id)
+    if user_tz is None:
         return dt_utc_aware
+    return dt_utc_aware.astimezone(user_tz)
+
+
+# Finished downloadable report bodies keyed by (user_id, date). Past
+# days rarely change, so repeat downloads skip the DB scan and rebuild;
+# any write or timezone change for the user drops their entries.
+_REPORT_FILE_TTL = 3600.0
+_REPORT_FILE_CACHE_MAX = 64
+_report_file_cache: dict[tuple[int, str], tuple[float, bytes]] = {}
+
+
+def _invalidate_report_cache(user_id: int) -> None:
+    """Drops all cached report files for the given user."""
+    for key in [k for k in _report_file_cache if k[0] == user_id]:
+        _report_file_cache.pop(key, None)
+
+
+def _build_merged_report(
+        user_id: int, report_date_str: str,
+        blocks: list[tuple[str, str]]
+) -> bytes:
+    """
+    Formats activity blocks into the downloadable report body.
+
+    Plain sync function so callers can push the timestamp parsing and
+    string assembly off the event loop via asyncio.to_thread.
+    """
+    report_lines = []
+    report_lines.append(f"The Activity Log: {report_date_str}")
+    report_lines.append(_REPORT_SEP)
+
+    # Specialized per-user formatter avoids re-resolving the timezone
+    # and re-parsing strftime formats for every row
+    format_time = _get_time_formatter(user_id)
+
+    # Each row starts a block; the next row's timestamp closes it
+    start_block_time_str = format_time(blocks[0][0])
+    for i in range(1, len(blocks)):
+        next_time_str = format_time(blocks[i][0])
+        report_lines.append(
+            f"{start_block_time_str} - "
+            f"{next_time_str} - {blocks[i - 1][1]}"
+        )
+        start_block_time_str = next_time_str
+
+    # Add the final, still-open block
+    report_lines.append(
+        f"{start_block_time_str} -       - {blocks[-1][1]}"
+    )
+
+    # Pass bytes straight to InputFile; a StringIO would make PTB re-read
+    # and re-encode the same content
+    return "\n".join(report_lines).encode("utf-8")
 
 
 async def _send_activity_report(
@@ -68,13 +368,24 @@ async def _send_activity_report(
 ):
     """Fetches, formats, and sends the activity report document."""
     logger.info(
-        f"Generating an activity report file for user {user_id}, "
-        f"date {report_date_str}."
+        "Generating an activity report file for user %s, date %s.",
+        user_id, report_date_str
     )
-    # DB function returns list of (activity_id, timestamp_str_utc, description)
-    activities = database.get_activities_for_day(user_id, report_date_str)
+    cache_key = (user_id, report_date_str)
+    cached = _report_file_cache.get(cache_key)
+    if cached is not None and cached[0] > time.monotonic():
+        report_bytes = cached[1]
+    else:
+        report_bytes = None
 
-    if not activities:
+    # SQLite collapses same-description runs via LAG, so each returned
+    # (timestamp_str_utc, description) row is already a block start
+    blocks = None
+    if report_bytes is None:
+        blocks = await _db(
+            database.get_activity_blocks_for_day, user_id, report_date_str)
+
+    if report_bytes is None and not blocks:
         try:
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -86,50 +397,33 @@ async def _send_activity_report(
             )
         return
 
-    report_lines = []
-    report_lines.append(f"The Activity Log: {report_date_str}")
-    report_lines.append("=" * 30)
-
-    # Use first activity to initialize the block
-    _, start_block_ts_str, current_desc = activities[0]
-    start_block_dt_utc = datetime.fromisoformat(start_block_ts_str)
-    start_block_dt_local = _get_user_local_time(user_id, start_block_dt_utc)
-
-    for i in range(1, len(activities)):
-        _, next_ts_str, next_desc = activities[i]
-        next_dt_utc = datetime.fromisoformat(next_ts_str)
-        next_dt_local = _get_user_local_time(user_id, next_dt_utc)
-
-        # If description changes, close the previous block
-        if next_desc != current_desc:
-            end_block_dt_local = next_dt_local
-            report_lines.append(
-                f"{start_block_dt_local.strftime('%H:%M')} - "
-                f"{end_block_dt_local.strftime('%H:%M')} - {current_desc}"
-            )
-            # Start new block
-            start_block_dt_local = next_dt_local
-            current_desc = next_desc
-
-    # Add the final block after the loop
-    report_lines.append(
-        f"{start_block_dt_local.strftime('%H:%M')} -       - {current_desc}"
-    )
-
-    report_content = "\n".join(report_lines)
-    report_file = io.StringIO(report_content)
+    if report_bytes is None:
+        # Formatting (and the formatter's tz lookup on a cache miss) runs
+        # on a worker thread so a heavy day never stalls the event loop
+        report_bytes = await asyncio.to_thread(
+            _build_merged_report, user_id, report_date_str, blocks)
+        # Evict expired entries on insert and keep the cache bounded, so
+        # inactive users' report bytes don't linger for the process life
+        now = time.monotonic()
+        for key in [k for k, (expiry, _) in _report_file_cache.items()
+                    if expiry <= now]:
+            del _report_file_cache[key]
+        if len(_report_file_cache) >= _REPORT_FILE_CACHE_MAX:
+            _report_file_cache.clear()
+        _report_file_cache[cache_key] = (
+            now + _REPORT_FILE_TTL, report_bytes)
     filename = f"activity_report_{report_date_str}.txt"
 
     try:
-        report_file.seek(0)
-        input_file = InputFile(report_file, filename=filename)
+        input_file = InputFile(report_bytes, filename=filename)
         await context.bot.send_document(
             chat_id=chat_id,
             document=input_file,
             caption=f"Here's your activity report for {report_date_str}."
         )
         logger.info(
-            f"Activity report file for {report_date_str} sent to chat_id {chat_id}."
+            "Activity report file for %s sent to chat_id %s.",
+            report_date_str, chat_id
         )
     except Exception as e:
         logger.error(
@@ -146,13 +440,67 @@ async def _send_activity_report(
                 f"Also failed to send error msg to chat_id {chat_id}: {e2}")
 
 
+def _build_editable_report(
+        user_id: int, report_date_str: str,
+        activities: list[tuple[int, str, str]]
+) -> tuple[str, InlineKeyboardMarkup]:
+    """
+    Builds the editable listing text and its inline keyboard.
+
+    Sync counterpart of _build_merged_report, for the same reason: the
+    per-row work happens on a worker thread, not the event loop.
+    """
+    # Resolve the timezone once for the whole listing instead of per row
+    format_time = _get_time_formatter(user_id)
+
+    # One pass computes (activity_id, time, short_desc) per row; the text
+    # lines and keyboard rows are then derived without re-slicing
+    rows = []
+    for activity_id, timestamp_str, description in activities:
+        try:
+            time_str = format_time(timestamp_str)
+        except ValueError:
+            logger.warning(
+                f"Could not parse timestamp '{timestamp_str}' for editable report."
+            )
+            time_str = "??:??"
+        # Ensure short_desc doesn't start/end with whitespace for cleaner look
+        desc_stripped = description.strip()
+        short_desc = (desc_stripped if len(desc_stripped) <= 50
+                      else desc_stripped[:50] + '...')
+        rows.append((activity_id, time_str, short_desc))
+
+    report_lines = [
+        f"Activities for {report_date_str} (Click ✏️ to edit):",
+        _LISTING_SEP,
+    ]
+    report_lines.extend(f"{time_str} - {short_desc}"
+                        for _, time_str, short_desc in rows)
+    keyboard = [
+        [InlineKeyboardButton(f"✏️ {short_desc}",
+                              callback_data=_EDIT_CB + str(activity_id))]
+        for activity_id, _, short_desc in rows
+    ]
+    keyboard.append([
+        InlineKeyboardButton(
+            "⬇️ Download .txt",
+            callback_data=_DOWNLOAD_CB + report_date_str
+        ),
+        InlineKeyboardButton(
+            "Cancel",
+            callback_data="edit_activity:cancel"
+        )
+    ])
+    return "\n".join(report_lines), InlineKeyboardMarkup(keyboard)
+
+
 async def _show_editable_activity_report(
         user_id: int, report_date_str: str, update: Update | CallbackQuery,
         context: ContextTypes.DEFAULT_TYPE
 ):
     """Fetches activities and shows them with Edit/Download buttons."""
     # DB function returns list of (activity_id, timestamp_str_utc, description)
-    activities = database.get_activities_for_day(user_id, report_date_str)
+    activities = await _db(database.get_activities_for_day, user_id, report_date_str)
 
     is_callback = isinstance(update, CallbackQuery)
     target_message = update.message if is_callback else update.message
@@ -170,46 +518,10 @@ async def _show_editable_activity_report(
             await context.bot.send_message(chat_id=user_id, text=no_data_text)
         return
 
-    report_lines = []
-    keyboard = []
-    report_lines.append(
-        f"Activities for {report_date_str} (Click ✏️ to edit):")
-    report_lines.append("-" * 30)
-
-    for activity_id, timestamp_str, description in activities:
-        try:
-            ts_utc_aware = datetime.fromisoformat(timestamp_str)
-            ts_local = _get_user_local_time(user_id, ts_utc_aware)
-            time_str = ts_local.strftime('%H:%M')
-            # Ensure short_desc doesn't start/end with whitespace for cleaner look
-            desc_stripped = description.strip()
-            short_desc = desc_stripped[:50] + \
-                ('...' if len(desc_stripped) > 50 else '')
-            report_lines.append(f"{time_str} - {short_desc}")
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"✏️ {short_desc}",
-                    callback_data=f"edit_activity:{activity_id}"
-                )
-            ])
-        except ValueError:
-            report_lines.append(f"??:?? - {description} (Error parsing time)")
-            logger.warning(
-                f"Could not parse timestamp '{timestamp_str}' for editable report."
-            )
-
-    report_content = "\n".join(report_lines)
-    keyboard.append([
-        InlineKeyboardButton(
-            "⬇️ Download .txt",
-            callback_data=f"download_report:{report_date_str}"
-        ),
-        InlineKeyboardButton(
-            "Cancel",
-            callback_data="edit_activity:cancel"
-        )
-    ])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Per-row formatting and keyboard assembly run off the event loop;
+    # InlineKeyboard* objects are plain data and safe to build there
+    report_content, reply_markup = await asyncio.to_thread(
+        _build_editable_report, user_id, report_date_str, activities)
 
     try:
         if is_callback:
@@ -235,38 +547,28 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     user_id = user.id
 
-    database.add_user_if_not_exists(user_id, user.username, user.first_name)
-    logger.info(f"User checked/added: id={user_id}, username={user.username}")
+    await _db(database.add_user_if_not_exists, user_id, user.username, user.first_name)
+    logger.info("User checked/added: id=%s, username=%s", user_id, user.username)
 
     # Store user_id for single-user polling job target (can be improved for multi-user)
     context.bot_data['user_id'] = user_id
     context.user_data.clear()  # Clear any previous state
-    logger.info(f"User {user_id} session initiated. ID stored in bot_data.")
-
-    keyboard = [
-        [KeyboardButton("📊 Activity Report")],
-        [KeyboardButton("🌐 Set Timezone"),
-         KeyboardButton("⏰ Set Poll Window")],
-        [KeyboardButton("🗓️ Set Report Time"),
-         KeyboardButton("❓ Help / Show Menu")],
-        [KeyboardButton("⌨️ Hide Keyboard")]
-    ]
-    reply_markup = ReplyKeyboardMarkup(
-        keyboard, resize_keyboard=True, one_time_keyboard=False,
-        input_field_placeholder="Use menu or reply to questions..."
-    )
+    logger.info("User %s session initiated. ID stored in bot_data.", user_id)
 
     info_text = (
         f"Hello, {user.mention_html()}! 👋 I'm your personal Time & Activity Tracker.\n\n"
         "I'll check in periodically to ask what you're up to. Just reply!\n\n"
         "Use the menu below or type /help for commands."
     )
-    await update.message.reply_html(info_text, reply_markup=reply_markup)
+    await update.message.reply_html(info_text, reply_markup=_MAIN_MENU)
+    # Telegram keeps the reply keyboard persistent; remember we sent it
+    # so /help can skip re-serializing the markup
+    context.user_data['keyboard_sent'] = True
 
     # Check timezone and prompt if needed
-    user_tz = database.get_user_timezone_str(user_id)
+    user_tz = await _db(database.get_user_timezone_str, user_id)
     if not user_tz:
-        logger.info(f"User {user_id} has no timezone set. Prompting.")
+        logger.info("User %s has no timezone set. Prompting.", user_id)
         tz_link_url = "https://en.wikipedia.org/wiki/List_of_tz_database_time_zones"
         timezone_prompt_text = (
             "⚠️ **Action needed: Set your timezone!**\n\n"
@@ -286,20 +588,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         return
     user = update.effective_user
     user_id = user.id
-    logger.info(f"User {user_id} requested help.")
-
-    keyboard = [
-        [KeyboardButton("📊 Activity Report")],
-        [KeyboardButton("🌐 Set Timezone"),
-         KeyboardButton("⏰ Set Poll Window")],
-        [KeyboardButton("🗓️ Set Report Time"),
-         KeyboardButton("❓ Help / Show Menu")],
-        [KeyboardButton("⌨️ Hide Keyboard")]
-    ]
-    reply_markup = ReplyKeyboardMarkup(
-        keyboard, resize_keyboard=True, one_time_keyboard=False,
-        input_field_placeholder="Use menu or reply to questions..."
-    )
+    logger.info("User %s requested help.", user_id)
 
     tz_link_url = "https://en.wikipedia.org/wiki/List_of_tz_database_time_zones"
     info_text = (
@@ -315,103 +604,118 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "<code>/help</code> - Show this summary.\n"
         "<code>/hide_keyboard</code> - Hide menu buttons.\n"
     )
+    # Resend the keyboard only if this chat doesn't already have it
+    markup = None if context.user_data.get('keyboard_sent') else _MAIN_MENU
     await update.message.reply_html(
-        info_text, reply_markup=reply_markup, disable_web_page_preview=True
+        info_text, reply_markup=markup, disable_web_page_preview=True
     )
+    if markup is not None:
+        context.user_data['keyboard_sent'] = True
 
 
 async def ask_now_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles /asknow: manually triggers activity poll (owner only)."""
+    """
+    Handles /asknow: manually triggers activity poll.
+
+    Owner-only: registered behind a filters.User(OWNER_ID) filter in
+    bot.py, so non-owner invocations never reach this coroutine.
+    """
     if not update.effective_user:
         return
     user_id = update.effective_user.id
 
-    # Check if OWNER_ID is valid before comparing
-    if not isinstance(OWNER_ID, int) or OWNER_ID == 0:
-        logger.error("OWNER_ID not set or invalid. Cannot execute /asknow.")
-        await update.message.reply_text("Sorry, owner ID not configured.")
-        return
-
-    if user_id != OWNER_ID:
-        logger.warning(f"User {user_id} (not owner) tried /asknow.")
-        await update.message.reply_text("Restricted command.")
-        return
-
-    logger.info(f"Owner ({user_id}) triggered activity poll via /asknow.")
+    logger.info("Owner (%s) triggered activity poll via /asknow.", user_id)
     await ask_activity(context)
     # Optional confirmation:
     # await update.message.reply_text("Manual activity poll initiated.")
 
 
-async def ask_activity(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Scheduled job: Polls all users with a timezone set about their activity."""
-    logger.info("Running scheduled activity poll job for relevant users.")
+POLL_SEND_CONCURRENCY = 8  # Parallel prompt sends per poll tick
 
-    user_ids_to_poll = database.get_all_user_ids_with_tz()
-
-    if not user_ids_to_poll:
-        logger.info("No users with timezone found to poll.")
-        return
-
-    logger.info(f"Found {len(user_ids_to_poll)} users to check for polling.")
-    polled_count = 0
-    now_utc = datetime.now(timezone.utc)
 
-    # Use bot_data for storing a flag
-    poll_states = context.bot_data.setdefault('user_poll_state', {})
-
-    for user_id in user_ids_to_poll:
-        logger.debug(f"Checking user {user_id} for activity poll.")
-
-        # To ensure failure for one user doesn't stop the loop for others.
+async def _poll_one_user(
+        user_id: int, now_utc: datetime, poll_states: dict,
+        context: ContextTypes.DEFAULT_TYPE, sem: asyncio.Semaphore
+) -> bool:
+    """Prompts a single user if due. Returns True when a prompt was sent."""
+    async with sem:
+        logger.debug("Checking user %s for activity poll.", user_id)
         try:
-            poll_window = database.get_user_poll_window(user_id)
+            poll_window = await _db(database.get_user_poll_window, user_id)
             start_h, end_h = poll_window or (DEFAULT_POLL_START_HOUR, DEFAULT_POLL_END_HOUR)
-            logger.debug(f"Using poll window {start_h}-{end_h} for user {user_id}")
+            logger.debug("Using poll window %s-%s for user %s", start_h, end_h, user_id)
 
-            user_local_time = _get_user_local_time(user_id, now_utc)
+            # Runs off-loop: the tz lookup hits SQLite when the 60s
+            # settings cache has expired between poll ticks
+            user_local_time = await _db(_get_user_local_time, user_id, now_utc)
 
             if not (start_h <= user_local_time.hour <= end_h):
                 logger.debug(
-                    f"Skipping poll for {user_id}: Local time "
-                    f"{user_local_time.strftime('%H:%M')} outside window {start_h}:00-{end_h}:59."
+                    "Skipping poll for %s: Local time %02d:%02d outside "
+                    "window %s:00-%s:59.",
+                    user_id, user_local_time.hour, user_local_time.minute,
+                    start_h, end_h
                 )
-                await asyncio.sleep(0.05) # Small delay even when skipping
-                continue
-
-            # Get the user-specific data dictionary, creating it if it doesn't exist
-            if not poll_states.get(user_id): # Проверяем флаг для этого user_id
+                return False
+
+            if not poll_states.get(user_id):
+                # Claim the flag before the awaits below; an overlapping
+                # job run (misfire catch-up) would otherwise pass the
+                # check too and double-prompt the user
+                poll_states[user_id] = True
+                await _tg_send_limiter.acquire()
                 await context.bot.send_message(chat_id=user_id, text="🤔 What are you doing right now?")
-                poll_states[user_id] = True # Устанавливаем флаг для этого user_id
                 logger.info(
-                    f"Activity inquiry sent to user {user_id} "
-                    f"at their local time {user_local_time.strftime('%H:%M')}."
+                    "Activity inquiry sent to user %s at their local time %02d:%02d.",
+                    user_id, user_local_time.hour, user_local_time.minute
                 )
-                polled_count += 1
-            else:
-                # Avoid spamming if user hasn't replied to the previous prompt
-                logger.warning(
-                    f"Tried asking user {user_id}, but previous response still pending."
-                )
-
-            # Pause briefly between users to respect potential rate limits
-            await asyncio.sleep(0.1)
-
+                return True
+            # Avoid spamming if user hasn't replied to the previous prompt
+            logger.warning(
+                f"Tried asking user {user_id}, but previous response still pending."
+            )
         except Forbidden:
             # Handle cases where the bot is blocked by the user
             logger.warning(
                 f"User {user_id} has blocked the bot. Cannot send activity prompt."
             )
-            poll_states.pop(user_id, None) # Reset the flag
+            poll_states.pop(user_id, None)  # Reset the flag
         except Exception as e:
-            # Catch any other error during processing for this specific user
             logger.error(
                 f"Error processing user {user_id} in ask_activity job: {e}",
-                exc_info=True # Include traceback for unexpected errors
+                exc_info=True  # Include traceback for unexpected errors
             )
-            poll_states.pop(user_id, None) # Reset the flag
+            poll_states.pop(user_id, None)  # Reset the flag
+        return False
+
 
-    logger.info(f"Finished activity poll job. Sent prompts to {polled_count} users.")
+async def ask_activity(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Scheduled job: Polls all users with a timezone set about their activity."""
+    logger.info("Running scheduled activity poll job for relevant users.")
+
+    user_ids_to_poll = await _db(database.get_all_user_ids_with_tz)
+
+    if not user_ids_to_poll:
+        logger.info("No users with timezone found to poll.")
+        return
+
+    logger.info("Found %s users to check for polling.", len(user_ids_to_poll))
+    now_utc = datetime.now(timezone.utc)
+
+    # Use bot_data for storing a flag
+    poll_states = context.bot_data.setdefault('user_poll_state', {})
+
+    # Fan out per-user checks/sends with bounded concurrency, mirroring
+    # the daily-report job; the shared token bucket keeps the combined
+    # send rate under Telegram's global cap
+    sem = asyncio.Semaphore(POLL_SEND_CONCURRENCY)
+    results = await asyncio.gather(*(
+        _poll_one_user(user_id, now_utc, poll_states, context, sem)
+        for user_id in user_ids_to_poll
+    ))
+    polled_count = sum(results)
+
+    logger.info("Finished activity poll job. Sent prompts to %s users.", polled_count)
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -424,7 +728,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     # 1. Check if user is editing an activity
     if context.user_data.get('is_editing_activity'):
-        logger.info(f"Received new description for editing from {user_id}")
+        logger.info("Received new description for editing from %s", user_id)
         activity_id = context.user_data.get('editing_activity_id')
         new_description = message_text
         reply_text = ""
@@ -434,9 +738,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 f"Edit text from {user_id}, but no activity_id in user_data.")
             reply_text = "😕 Sorry, I lost track. Please start the edit again via /report."
         else:
-            was_updated = database.update_activity_description(
+            was_updated = await _db(
+                database.update_activity_description,
                 activity_id, user_id, new_description)
             if was_updated:
+                _invalidate_report_cache(user_id)
                 reply_text = f"✅ Activity updated!"
             else:
                 reply_text = f"😕 Failed to update activity. Not found?"
@@ -450,16 +756,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     poll_states = context.bot_data.setdefault('user_poll_state', {})
     if poll_states.get(user_id):
         logger.info(
-            f"Received activity response from {user_id}: {message_text}")
+            "Received activity response from %s: %s", user_id, message_text)
         poll_states.pop(user_id, None)
         
         description_to_save = message_text
         now_utc = datetime.now(timezone.utc)  # Store time in UTC
 
-        activity_id = database.save_activity_to_db(
+        activity_id = await _db(
+            database.save_activity_to_db,
             user_id, description_to_save, now_utc)
 
         if activity_id is not None:
+            _invalidate_report_cache(user_id)
             reply_text = f"✅ Got it! Logged: \"{description_to_save}\"."
         else:
             reply_text = "😥 Sorry, error saving activity."
@@ -469,7 +777,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # 3. Handle other messages (currently ignored)
     else:
         logger.info(
-            f"Received unexpected message from {user_id}: '{message_text}'")
+            "Received unexpected message from %s: '%s'", user_id, message_text)
         # Optionally reply: await update.message.reply_text("Use commands or reply when prompted.")
 
 
@@ -491,9 +799,13 @@ async def set_timezone_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     timezone_name = context.args[0]
     try:
         # Validate timezone name
-        ZoneInfo(timezone_name)
-        if database.update_user_timezone(user_id, timezone_name):
-            logger.info(f"User {user_id} set timezone to {timezone_name}")
+        _zoneinfo(timezone_name)
+        if await _db(database.update_user_timezone, user_id, timezone_name):
+            # Drop any specialized formatter built for the old timezone,
+            # and report files rendered with it
+            _time_formatter_cache.pop(user_id, None)
+            _invalidate_report_cache(user_id)
+            logger.info("User %s set timezone to %s", user_id, timezone_name)
             await update.message.reply_text(f"👍 Timezone set to: {timezone_name}")
         else:
             logger.error(f"Failed to update timezone in DB for user {user_id}")
@@ -529,9 +841,9 @@ async def set_poll_window_handler(update: Update, context: ContextTypes.DEFAULT_
         if start_hour >= end_hour:
             raise ValueError("Start hour must be less than end hour.")
 
-        if database.update_user_poll_window(user_id, start_hour, end_hour):
+        if await _db(database.update_user_poll_window, user_id, start_hour, end_hour):
             logger.info(
-                f"User {user_id} set poll window: {start_hour}-{end_hour}")
+                "User %s set poll window: %s-%s", user_id, start_hour, end_hour)
             await update.message.reply_text(f"✅ Poll window set: {start_hour:02d}:00 - {end_hour:02d}:59.")
         else:
             await update.message.reply_text("😥 Failed to save setting.")
@@ -564,8 +876,8 @@ async def set_report_time_handler(update: Update, context: ContextTypes.DEFAULT_
         if not (0 <= report_hour <= 23):
             raise ValueError("Hour must be between 0 and 23.")
 
-        if database.update_user_report_hour(user_id, report_hour):
-            logger.info(f"User {user_id} set report hour to {report_hour}")
+        if await _db(database.update_user_report_hour, user_id, report_hour):
+            logger.info("User %s set report hour to %s", user_id, report_hour)
             await update.message.reply_text(f"✅ Daily report will be sent around {report_hour:02d}:00 local time.")
         else:
             await update.message.reply_text("😥 Failed to save setting.")
@@ -588,41 +900,153 @@ async def report_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if context.args:
         try:
-            datetime.strptime(context.args[0], '%Y-%m-%d')
+            _parse_ymd(context.args[0])
             report_date_str = context.args[0]
         except (ValueError, IndexError):
             await update.message.reply_text("Invalid date format. Please use YYYY-MM-DD.")
             return
         logger.info(
-            f"User {user_id} requesting report for specific date: {report_date_str}.")
+            "User %s requesting report for specific date: %s.",
+            user_id, report_date_str)
         await _show_editable_activity_report(user_id, report_date_str, update, context)
     else:
         logger.info(
-            f"User {user_id} requesting report without date. Sending options...")
-        # Use local time for button dates if timezone is set, else UTC
-        now_local = _get_user_local_time(user_id, datetime.now(timezone.utc))
-        today_local = now_local.date()
-        yesterday_local = today_local - timedelta(days=1)
-        today_str = today_local.strftime('%Y-%m-%d')
-        yesterday_str = yesterday_local.strftime('%Y-%m-%d')
-
-        keyboard = [[
-            InlineKeyboardButton(
-                "Today", callback_data=f"report_select:activity:{today_str}"),
-            InlineKeyboardButton(
-                "Yesterday", callback_data=f"report_select:activity:{yesterday_str}")
-        ], [
-            InlineKeyboardButton(
-                "Cancel", callback_data="report_select:cancel")
-        ]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+            "User %s requesting report without date. Sending options...", user_id)
+        # Use local date for button dates if timezone is set, else UTC.
+        # Cached per minute so repeated /report calls skip zoneinfo.
+        # Off-loop for the same reason as the poll job: a cold minute
+        # bucket means a synchronous timezone query underneath
+        today_local = await _db(
+            _cached_local_date, user_id, int(time.time()) // 60)
+        reply_markup = _get_report_menu_markup(today_local)
         await update.message.reply_text("🗓️ Select report period:", reply_markup=reply_markup)
 
 
 # --- Button handlers ---
 
+async def _handle_report_select(
+        rest: str, query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE,
+        user_id: int
+) -> bool:
+    """Handles 'report_select:*' callbacks. Returns True if still unanswered."""
+    if rest == 'cancel':
+        logger.info("User %s cancelled report selection.", user_id)
+        try:
+            await query.edit_message_text(text="OK, report selection cancelled.")
+        except Exception:
+            pass  # Ignore if editing fails
+        return False
+
+    report_type, sep, selected_date_str = rest.partition(":")
+    if sep and selected_date_str:
+        try:
+            # Callback data is client-supplied; reject junk dates before
+            # they reach the DB helpers (which expect YYYY-MM-DD)
+            _parse_ymd(selected_date_str)
+        except ValueError:
+            logger.error(f"Invalid date in 'report_select': {query.data}")
+            await context.bot.send_message(
+                chat_id=user_id, text="Sorry, internal error (format).")
+            return False
+        logger.info(
+            "User %s selected date %s for %s report.",
+            user_id, selected_date_str, report_type)
+        try:
+            await query.edit_message_text(text=f"Loading {report_type} entries for {selected_date_str}...")
+        except Exception:
+            pass  # Ignore if editing fails
+        if report_type == "activity":
+            await _show_editable_activity_report(user_id, selected_date_str, query, context)
+        else:
+            logger.error(f"Unknown report type '{report_type}'")
+            await context.bot.send_message(chat_id=user_id, text="Sorry, internal error (report type).")
+    else:
+        logger.error(f"Invalid 'report_select' format: {query.data}")
+        await context.bot.send_message(chat_id=user_id, text="Sorry, internal error (format).")
+    return False
+
+
+async def _handle_edit_activity(
+        rest: str, query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE,
+        user_id: int
+) -> bool:
+    """Handles 'edit_activity:*' callbacks. Returns True if still unanswered."""
+    if rest == "cancel":
+        logger.info("User %s cancelled activity edit list.", user_id)
+        try:
+            await query.edit_message_text(text="OK, activity list closed.")
+        except Exception:
+            pass
+        return False
+
+    try:
+        activity_id_to_edit = int(rest)
+        context.user_data['is_editing_activity'] = True
+        context.user_data['editing_activity_id'] = activity_id_to_edit
+        logger.info(
+            "User %s initiated edit for activity_id %s",
+            user_id, activity_id_to_edit)
+        await query.edit_message_text(text=f"Okay, please send the new description for activity:")
+    except (ValueError, IndexError):
+        logger.error(f"Cannot parse activity_id: {query.data}")
+        await query.edit_message_text(text="Error: Invalid edit request.")
+    except Exception as e:
+        logger.error(f"Error initiating edit: {e}", exc_info=True)
+        context.user_data.pop('is_editing_activity', None)
+        context.user_data.pop('editing_activity_id', None)
+        await query.edit_message_text(text="Sorry, an error occurred.")
+    return False
+
+
+async def _handle_download_report(
+        rest: str, query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE,
+        user_id: int
+) -> bool:
+    """Handles 'download_report:*' callbacks. Returns True if still unanswered."""
+    report_date_str = rest
+    try:
+        logger.info("Extracted date for download: '%s'", report_date_str)
+        parsed_date = _parse_ymd(report_date_str)
+        logger.info("Date parsed successfully: %s", parsed_date)
+        logger.info(
+            "User %s confirmed download request for date: %s",
+            user_id, report_date_str)
+        await query.answer("Preparing your report file...")
+        await _send_activity_report(user_id, report_date_str, query.message.chat_id, context)
+    except (ValueError, IndexError) as e:
+        logger.error(
+            f"Error parsing date '{report_date_str}' from {query.data}: {e}")
+        await query.answer("Error: Invalid data received.", show_alert=True)
+    except Exception as e:
+        logger.error(
+            f"Error processing download request for '{report_date_str}': {e}", exc_info=True)
+        await query.answer("Sorry, error generating file.", show_alert=True)
+    return False
+
+
+# Fixed report separator lines, built once instead of per invocation
+_REPORT_SEP = "=" * 30
+_LISTING_SEP = "-" * 30
+
+# Callback-data prefixes, also used when composing payload strings
+_EDIT_CB = "edit_activity:"
+_DOWNLOAD_CB = "download_report:"
+
+# Prefix (before the first ':') -> coroutine handling the callback
+_CB_HANDLERS = {
+    "report_select": _handle_report_select,
+    "edit_activity": _handle_edit_activity,
+    "download_report": _handle_download_report,
+}
+
+# Prefixes that only ever need a plain ack (no text, no alert): for these
+# the ack is fired concurrently so its round-trip overlaps the handler's
+# DB and API work instead of preceding it
+_ACK_EARLY_PREFIXES = frozenset({"report_select", "edit_activity"})
+
+
 async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles all inline button presses."""
+    """Handles all inline button presses via prefix dispatch."""
     if not update.callback_query or not update.effective_user:
         return
     query = update.callback_query
@@ -630,88 +1054,26 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
     user_id = query.from_user.id
     needs_answer = True
 
-    logger.info(f"Received callback: user={user_id}, data='{callback_data}'")
+    logger.info("Received callback: user=%s, data='%s'", user_id, callback_data)
 
-    if callback_data.startswith("report_select:"):
-        parts = callback_data.split(":")
-        if len(parts) >= 2 and parts[1] == 'cancel':
-            logger.info(f"User {user_id} cancelled report selection.")
-            try:
-                await query.edit_message_text(text="OK, report selection cancelled.")
-            except Exception:
-                pass  # Ignore if editing fails
+    # Single split + dict lookup instead of chained startswith scans
+    prefix, sep, rest = callback_data.partition(":")
+    handler = _CB_HANDLERS.get(prefix) if sep else None
+    if handler:
+        if prefix in _ACK_EARLY_PREFIXES:
+            # Clear the client's spinner right away; the answer round-trip
+            # then overlaps the handler body instead of delaying it
+            ack_task = asyncio.create_task(query.answer())
             needs_answer = False
-        elif len(parts) == 3:
-            report_type = parts[1]
-            selected_date_str = parts[2]
-            logger.info(
-                f"User {user_id} selected date {selected_date_str} for {report_type} report.")
             try:
-                await query.edit_message_text(text=f"Loading {report_type} entries for {selected_date_str}...")
-            except Exception:
-                pass  # Ignore if editing fails
-            if report_type == "activity":
-                await _show_editable_activity_report(user_id, selected_date_str, query, context)
-            else:
-                logger.error(f"Unknown report type '{report_type}'")
-                await context.bot.send_message(chat_id=user_id, text="Sorry, internal error (report type).")
-            needs_answer = False
+                await handler(rest, query, context, user_id)
+            finally:
+                try:
+                    await ack_task
+                except Exception:
+                    pass  # Ignore if already answered/expired
         else:
-            logger.error(f"Invalid 'report_select' format: {callback_data}")
-            await context.bot.send_message(chat_id=user_id, text="Sorry, internal error (format).")
-            needs_answer = False
-
-    elif callback_data.startswith("edit_activity:"):
-        if callback_data == "edit_activity:cancel":
-            logger.info(f"User {user_id} cancelled activity edit list.")
-            try:
-                await query.edit_message_text(text="OK, activity list closed.")
-            except Exception:
-                pass
-            needs_answer = False
-        else:
-            try:
-                activity_id_to_edit = int(callback_data.split(":", 1)[1])
-                context.user_data['is_editing_activity'] = True
-                context.user_data['editing_activity_id'] = activity_id_to_edit
-                logger.info(
-                    f"User {user_id} initiated edit for activity_id {activity_id_to_edit}")
-                await query.edit_message_text(text=f"Okay, please send the new description for activity:")
-                needs_answer = False
-            except (ValueError, IndexError):
-                logger.error(f"Cannot parse activity_id: {callback_data}")
-                await query.edit_message_text(text="Error: Invalid edit request.")
-                needs_answer = False
-            except Exception as e:
-                logger.error(f"Error initiating edit: {e}", exc_info=True)
-                context.user_data.pop('is_editing_activity', None)
-                context.user_data.pop('editing_activity_id', None)
-                await query.edit_message_text(text="Sorry, an error occurred.")
-                needs_answer = False
-
-    elif callback_data.startswith("download_report:"):
-        report_date_str = "PARSE_ERROR"
-        try:
-            report_date_str = callback_data.split(":", 1)[1]
-            logger.info(f"Extracted date for download: '{report_date_str}'")
-            parsed_date = datetime.strptime(report_date_str, '%Y-%m-%d')
-            logger.info(f"Date parsed successfully: {parsed_date}")
-            logger.info(
-                f"User {user_id} confirmed download request for date: {report_date_str}")
-            await query.answer("Preparing your report file...")
-            needs_answer = False
-            await _send_activity_report(user_id, report_date_str, query.message.chat_id, context)
-        except (ValueError, IndexError) as e:
-            logger.error(
-                f"Error parsing date '{report_date_str}' from {callback_data}: {e}")
-            await query.answer("Error: Invalid data received.", show_alert=True)
-            needs_answer = False
-        except Exception as e:
-            logger.error(
-                f"Error processing download request for '{report_date_str}': {e}", exc_info=True)
-            await query.answer("Sorry, error generating file.", show_alert=True)
-            needs_answer = False
-
+            needs_answer = await handler(rest, query, context, user_id)
     else:
         logger.warning(f"Unhandled callback_data received: {callback_data}")
 
@@ -725,44 +1087,38 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
 
 async def hide_keyboard_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handles /hide_keyboard command."""
-    if not update.effective_user:
+    if not update.effective_user or not update.message:
         return
     user_id = update.effective_user.id
-    logger.info(f"User {user_id} requested to hide reply keyboard.")
+    logger.info("User %s requested to hide reply keyboard.", user_id)
+    context.user_data.pop('keyboard_sent', None)
     await update.message.reply_text("OK, custom keyboard hidden. Use /start or /help to bring it back.", reply_markup=ReplyKeyboardRemove())
 
+@_single_flight("tz_btn")
 async def set_timezone_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handles the 'Set Timezone' button press by showing the current timezone
     and instructions on how to set it using the command.
     """
-    if not update.effective_user:
+    if not update.effective_user or not update.message:
         # Should not happen in private chat, but good practice to check
         return
     user_id = update.effective_user.id
-    logger.info(f"User {user_id} pressed 'Set Timezone' button.")
+    logger.info("User %s pressed 'Set Timezone' button.", user_id)
 
     # Get current setting from DB
-    current_tz = database.get_user_timezone_str(user_id)
+    current_tz = await _db(database.get_user_timezone_str, user_id)
 
-    # Prepare first part of the message
+    # Prepare dynamic prefix; the instructions are a module-level constant
     if current_tz:
         message_part1 = f"Your currently set timezone is: <code>{current_tz}</code>\n\n"
     else:
         message_part1 = "Your timezone is not set yet.\n\n"
 
-    # Prepare second part (instructions)
-    tz_link_url = "https://en.wikipedia.org/wiki/List_of_tz_database_time_zones"
-    message_part2 = (
-        "To set or change it, use the command followed by the timezone name.\n"
-        "Example: <code>/set_timezone Asia/Almaty</code>\n\n"
-        f"Find standard names (IANA format) <a href='{tz_link_url}'>here</a>."
-    )
-
     # Send the combined message
     try:
         await update.message.reply_text(
-            message_part1 + message_part2,
+            "".join((message_part1, _TZ_INSTRUCTIONS)),
             parse_mode=ParseMode.HTML,
             disable_web_page_preview=True
         )
@@ -770,67 +1126,61 @@ async def set_timezone_button_handler(update: Update, context: ContextTypes.DEFA
          # Log error if message sending fails
          logger.error(f"Error sending timezone info message to user {user_id}: {e}")
 
+@_single_flight("poll_btn")
 async def set_poll_window_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handles the 'Set Poll Window' button press by showing current setting
     and instructions on how to set it using the command.
     """
-    if not update.effective_user: return
+    if not update.effective_user or not update.message: return
     user_id = update.effective_user.id
-    logger.info(f"User {user_id} pressed 'Set Poll Window' button.")
+    logger.info("User %s pressed 'Set Poll Window' button.", user_id)
 
     # Get current setting from DB or use defaults
-    window = database.get_user_poll_window(user_id)
+    window = await _db(database.get_user_poll_window, user_id)
     start_h_disp, end_h_disp = window if window else (DEFAULT_POLL_START_HOUR, DEFAULT_POLL_END_HOUR)
 
-    # Prepare message parts
+    # Prepare dynamic prefix; the instructions are a module-level constant
     message_part1 = (
         f"Your current polling window is set from "
         f"<code>{start_h_disp:02d}:00</code> to "
         f"<code>{end_h_disp:02d}:59</code> local time.\n\n"
     )
-    message_part2 = (
-        "To change it, use the command followed by start and end hours (0-23).\n"
-        "Example: <code>/set_poll_window 9 18</code>"
-    )
 
     # Send message
     try:
         await update.message.reply_text(
-            message_part1 + message_part2,
+            "".join((message_part1, _POLL_INSTRUCTIONS)),
             parse_mode=ParseMode.HTML
         )
     except Exception as e:
         logger.error(f"Error sending poll window info to user {user_id}: {e}")
 
 
+@_single_flight("report_btn")
 async def set_report_time_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handles the 'Set Report Time' button press by showing current setting
     and instructions on how to set it using the command.
     """
-    if not update.effective_user: return
+    if not update.effective_user or not update.message: return
     user_id = update.effective_user.id
-    logger.info(f"User {user_id} pressed 'Set Report Time' button.")
+    logger.info("User %s pressed 'Set Report Time' button.", user_id)
 
     # Get current setting from DB or use default
-    hour = database.get_user_report_hour(user_id)
+    hour = await _db(database.get_user_report_hour, user_id)
     hour_disp = hour if hour is not None else DEFAULT_REPORT_HOUR
 
-    # Prepare message parts
+    # Prepare dynamic prefix; the instructions are a module-level constant
     message_part1 = (
         f"Your daily report is currently scheduled around "
         f"<code>{hour_disp:02d}:00</code> local time.\n\n"
     )
-    message_part2 = (
-        "To change it, use the command followed by the desired hour (0-23).\n"
-        "Example: <code>/set_report_time 7</code> (for 7 AM)"
-    )
 
     # Send message
     try:
         await update.message.reply_text(
-            message_part1 + message_part2,
+            "".join((message_part1, _REPORT_INSTRUCTIONS)),
             parse_mode=ParseMode.HTML
         )
     except Exception as e:
@@ -847,56 +1197,121 @@ hide_keyboard_button_handler = hide_keyboard_handler
 
 
 # --- Job function for daily reports ---
+
+# Sampler for per-user error tracebacks in the report job
+_report_job_err_sampler = itertools.count()
+
+# Bounded fan-out setting for daily report delivery
+REPORT_SEND_CONCURRENCY = 8
+
+
+async def _send_one_daily_report(
+        user_id: int, report_date_str: str,
+        context: ContextTypes.DEFAULT_TYPE,
+        sem: asyncio.Semaphore
+) -> None:
+    """Sends one user's daily report under the shared concurrency limits."""
+    async with sem:
+        await _tg_send_limiter.acquire()
+        logger.debug(
+            "Attempting _send_activity_report for user %s, date %s",
+            user_id, report_date_str)
+        await _send_activity_report(user_id, report_date_str, user_id, context)
+
+
 async def check_and_send_daily_reports_job(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Scheduled job: Checks and sends daily reports to users around 8 AM local time."""
     logger.info("Running hourly check for sending daily reports.")
-    user_ids_to_check = database.get_all_user_ids_with_tz()
-    if not user_ids_to_check:
+    # One batched query instead of 3 round-trips per user
+    report_candidates = await _db(database.get_users_due_for_report)
+    if not report_candidates:
         logger.info("No users with timezone found to check.")
         return
 
     now_utc = datetime.now(timezone.utc)
-    processed_users = 0
-    for user_id in user_ids_to_check:
-        logger.debug(f"Checking daily report status for user {user_id}.")
+    # Many users share a timezone, so convert 'now' once per distinct tz
+    # instead of once per user; per user this leaves a dict lookup and an
+    # integer hour compare
+    # Per distinct tz: (utc offset, local hour). The hour check only needs
+    # integer arithmetic on the offset; the full local datetime is built
+    # lazily below, and only for timezones where a report is actually due.
+    local_now_by_tz: dict[str, tuple[timedelta, int]] = {}
+    utc_minutes = now_utc.hour * 60 + now_utc.minute
+    yday_str_by_tz: dict = {}  # tz offset -> yesterday ISO string
+    due_users = []  # (user_id, report_date_str) pairs actually due now
+    for user_id, tz_str, effective_report_hour, last_sent_date_str in report_candidates:
+        logger.debug("Checking daily report status for user %s.", user_id)
         try:
-            user_local_time = _get_user_local_time(user_id, now_utc)
-            report_hour_setting = database.get_user_report_hour(user_id)
-            effective_report_hour = report_hour_setting if report_hour_setting is not None else DEFAULT_REPORT_HOUR
+            cached = local_now_by_tz.get(tz_str)
+            if cached is None:
+                try:
+                    offset = _zoneinfo(tz_str).utcoffset(now_utc)
+                except ZoneInfoNotFoundError:
+                    logger.error(
+                        f"Invalid timezone '{tz_str}' in DB for user {user_id}. Using UTC.")
+                    offset = timedelta(0)
+                local_hour = (
+                    (utc_minutes + offset // timedelta(minutes=1)) // 60) % 24
+                cached = (offset, local_hour)
+                local_now_by_tz[tz_str] = cached
+            offset, local_hour = cached
             logger.debug(
-                f"User {user_id}: Local time {user_local_time.strftime('%H:%M %Z%z')}, Target report hour: {effective_report_hour}")
-
-            if user_local_time.hour == effective_report_hour:
-                report_date_local = user_local_time.date() - timedelta(days=1)
-                report_date_str = report_date_local.strftime('%Y-%m-%d')
-                last_sent_date_str = database.get_last_report_sent_date(
-                    user_id)
+                "User %s: Local hour %02d in %s, Target report hour: %s",
+                user_id, local_hour, tz_str, effective_report_hour)
+
+            if local_hour == effective_report_hour:
+                # Users sharing an offset share "yesterday"; isoformat is
+                # also cheaper than strftime('%Y-%m-%d')
+                report_date_str = yday_str_by_tz.get(offset)
+                if report_date_str is None:
+                    report_date_local = (now_utc + offset).date() \
+                        - timedelta(days=1)
+                    report_date_str = report_date_local.isoformat()
+                    yday_str_by_tz[offset] = report_date_str
                 logger.debug(
-                    f"User {user_id}: Checking report for {report_date_str}, last sent was {last_sent_date_str}")
+                    "User %s: Checking report for %s, last sent was %s",
+                    user_id, report_date_str, last_sent_date_str)
                 if last_sent_date_str != report_date_str:
                     logger.info(
-                        f"It's report time for user {user_id}. Sending report for {report_date_str}.")
-                    try:
-                        logger.debug(
-                            f"Attempting _send_activity_report for user {user_id}, date {report_date_str}")
-                        await _send_activity_report(user_id, report_date_str, user_id, context)
-                        logger.debug(
-                            f"Attempting update_last_report_sent_date for user {user_id} to {report_date_str}")
-                        database.update_last_report_sent_date(
-                            user_id, report_date_str)
-                        processed_users += 1
-                        await asyncio.sleep(0.3)
-                    except Exception as send_e:
-                        logger.error(
-                            f"Failed sending daily report to user {user_id}: {send_e}", exc_info=False)
+                        "It's report time for user %s. Queuing report for %s.",
+                        user_id, report_date_str)
+                    due_users.append((user_id, report_date_str))
                 else:
                     logger.info(
-                        f"Report for {report_date_str} already sent to user {user_id}.")
+                        "Report for %s already sent to user %s.",
+                        report_date_str, user_id)
             # No need for else clause logging 'Not report time' every hour for every user
         except Exception as user_e:
+            # Sample full tracebacks: formatting one per failing user is
+            # expensive and floods the logs when an outage hits everyone
+            with_traceback = next(_report_job_err_sampler) % 100 == 0
             logger.error(
-                f"Error processing user {user_id} in daily report job: {user_e}", exc_info=True)
+                "Error processing user %s in daily report job: %r",
+                user_id, user_e, exc_info=with_traceback)
 
-    if processed_users > 0:
-        logger.info(f"Finished report check. Sent to {processed_users} users.")
-    # No need to log when no reports were sent this hour
+    if not due_users:
+        # No need to log when no reports were sent this hour
+        return
+
+    # Fan out the sends with bounded concurrency instead of awaiting each
+    # user serially, so the event loop overlaps Telegram API round-trips
+    sem = asyncio.Semaphore(REPORT_SEND_CONCURRENCY)
+    tasks = [
+        _send_one_daily_report(user_id, report_date_str, context, sem)
+        for user_id, report_date_str in due_users
+    ]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Record all successful sends in one transaction instead of one
+    # commit (and fsync) per user
+    sent_updates = []  # (date_str, user_id) for executemany
+    for (user_id, report_date_str), result in zip(due_users, results):
+        if isinstance(result, Exception):
+            logger.error(
+                f"Failed sending daily report to user {user_id}: {result}", exc_info=False)
+        else:
+            sent_updates.append((report_date_str, user_id))
+    if sent_updates:
+        await _db(database.update_last_report_sent_dates, sent_updates)
+        logger.info(
+            "Finished report check. Sent to %s users.", len(sent_updates))